@@ -9,9 +9,12 @@ Usage:
 
 import argparse
 import requests
+from requests.adapters import HTTPAdapter, Retry
 import json
 import os
+import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 try:
@@ -19,13 +22,168 @@ try:
     import numpy as np
     import rasterio
     from rasterio.transform import from_bounds
-    from scipy.interpolate import griddata
+    from scipy.spatial import cKDTree
 except ImportError as e:
     print(f"Missing required library: {e}")
     print("Install with conda:")
     print("  conda install -c conda-forge laspy rasterio scipy")
     sys.exit(1)
 
+# tqdm is optional: downloads fall back to throttled percentage prints
+try:
+    from tqdm import tqdm
+    HAVE_TQDM = True
+except ImportError:
+    HAVE_TQDM = False
+
+# requests-cache is optional: API queries fall back to plain requests
+try:
+    import requests_cache
+    HAVE_REQUESTS_CACHE = True
+except ImportError:
+    HAVE_REQUESTS_CACHE = False
+
+# Numba is optional: the binning kernel falls back to np.add.at without it
+try:
+    from numba import njit, prange, get_num_threads
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _bin_points_numba(xo, yo, z, inv_dx, inv_dy,
+                          width, height, sums_tls, counts_tls):
+        # Thread-local accumulators avoid write races; owned and reduced
+        # by the caller so they can be reused across point chunks.
+        # Coordinates arrive as float32 offsets from the tile origin,
+        # where float32 resolution is ample
+        nthreads = sums_tls.shape[0]
+        n = xo.size
+        chunk = (n + nthreads - 1) // nthreads
+        for t in prange(nthreads):
+            start = t * chunk
+            stop = min(start + chunk, n)
+            for i in range(start, stop):
+                c = int(xo[i] * inv_dx)
+                r = int(yo[i] * inv_dy)
+                if c < 0:
+                    c = 0
+                elif c >= width:
+                    c = width - 1
+                if r < 0:
+                    r = 0
+                elif r >= height:
+                    r = height - 1
+                sums_tls[t, r, c] += z[i]
+                counts_tls[t, r, c] += 1
+
+
+# PCG64 generator for sample data; seeded so test terrain is reproducible
+rng = np.random.default_rng(seed=0)
+
+# Cells per parallel fill tile; also the threshold below which the
+# fill runs in-process (process startup would dominate)
+FILL_TILE_SIZE = 65536
+
+
+def _query_fill_tile(args):
+    tree, tile = args
+    _, idx = tree.query(tile, k=1)
+    return idx
+
+
+def fill_empty_cells(grid_z, counts):
+    """
+    Fill cells that received no points from their nearest populated cell
+
+    The KD-tree over populated cells is built once and queried for the
+    empty cells only; large grids split the queries across worker
+    processes in disjoint tiles.
+    """
+    # One pass to build the mask; everything below reuses it
+    empty = counts == 0
+    empty_rc = np.argwhere(empty)
+    if len(empty_rc) == 0:
+        return
+
+    print("  Filling empty cells...")
+    np.logical_not(empty, out=empty)
+    filled_rc = np.argwhere(empty)
+    tree = cKDTree(filled_rc)
+
+    if len(empty_rc) <= FILL_TILE_SIZE:
+        _, idx = tree.query(empty_rc, k=1, workers=-1)
+    else:
+        tiles = [empty_rc[i:i + FILL_TILE_SIZE]
+                 for i in range(0, len(empty_rc), FILL_TILE_SIZE)]
+        with ProcessPoolExecutor() as pool:
+            results = pool.map(_query_fill_tile, [(tree, t) for t in tiles])
+        idx = np.concatenate(list(results))
+
+    nearest = filled_rc[idx]
+    grid_z[empty_rc[:, 0], empty_rc[:, 1]] = grid_z[nearest[:, 0], nearest[:, 1]]
+
+
+def alloc_bin_tls(width, height):
+    """
+    Allocate zeroed thread-local accumulators for the Numba binning
+    kernel, or None when Numba is unavailable
+
+    Allocate once per conversion and reuse across point chunks, then
+    fold into the output arrays with reduce_bin_tls after the last chunk.
+    """
+    if not HAVE_NUMBA:
+        return None
+    nthreads = get_num_threads()
+    return (np.zeros((nthreads, height, width), dtype=np.float32),
+            np.zeros((nthreads, height, width), dtype=np.int32))
+
+
+def reduce_bin_tls(tls, sums, counts):
+    """Fold thread-local accumulators into the per-cell sums and counts"""
+    sums_tls, counts_tls = tls
+    sums += sums_tls.sum(axis=0)
+    counts += counts_tls.sum(axis=0)
+
+
+def bin_points(x, y, z, x_min, x_max, y_min, y_max, width, height,
+               sums, counts, tls=None):
+    """
+    Accumulate point elevations into per-cell sums and counts arrays
+
+    Points are mapped to cells by the affine transform (x - x_min) *
+    inv_dx directly; no grid coordinate arrays are materialized. With
+    Numba, pass tls from alloc_bin_tls and call reduce_bin_tls once
+    after the final chunk; without tls the reduction happens per call.
+    """
+    inv_dx = (width - 1) / (x_max - x_min)
+    inv_dy = (height - 1) / (y_max - y_min)
+
+    if HAVE_NUMBA:
+        # Subtract the origin in float64 first: absolute UTM coordinates
+        # lose sub-meter precision in float32, offsets do not
+        xo = (np.asarray(x, dtype=np.float64) - x_min).astype(np.float32)
+        yo = (np.asarray(y, dtype=np.float64) - y_min).astype(np.float32)
+        local_tls = tls if tls is not None else alloc_bin_tls(width, height)
+        _bin_points_numba(
+            xo, yo, np.asarray(z, dtype=np.float32),
+            inv_dx, inv_dy, width, height, local_tls[0], local_tls[1]
+        )
+        if tls is None:
+            reduce_bin_tls(local_tls, sums, counts)
+    else:
+        # laspy hands back ScaledArrayView objects whose __array_ufunc__
+        # breaks ufunc.at; convert to plain ndarrays first
+        x = np.asarray(x)
+        y = np.asarray(y)
+        z = np.asarray(z)
+        col = np.clip(((x - x_min) * inv_dx).astype(np.int32), 0, width - 1)
+        row = np.clip(((y - y_min) * inv_dy).astype(np.int32), 0, height - 1)
+        np.add.at(sums, (row, col), z)
+        np.add.at(counts, (row, col), 1)
+
 
 class USGSLidarFetcher:
     """Fetches and processes USGS 3DEP LiDAR data into DEM rasters"""
@@ -36,7 +194,33 @@ class USGSLidarFetcher:
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         self.resolution = resolution  # meters per pixel
-        
+        # Bounds and grid geometry per (path, mtime), for repeated
+        # conversions of the same tiles in batch workflows
+        self._bounds_cache = {}
+
+        # Cache API responses on disk for 24h so repeated runs against
+        # the same location skip the tnmaccess round-trip
+        if HAVE_REQUESTS_CACHE:
+            self.api_session = requests_cache.CachedSession(
+                str(self.output_dir / '.tnm_cache'),
+                backend='sqlite',
+                expire_after=86400
+            )
+        else:
+            self.api_session = requests.Session()
+
+        # Shared session for downloads: reuses connections across tiles
+        # and retries transient failures with backoff
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=3, backoff_factor=0.5)
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.api_session.mount('https://', adapter)
+
     def find_lidar_tiles(self):
         """
         Query USGS The National Map API to find available LiDAR tiles
@@ -58,7 +242,7 @@ class USGSLidarFetcher:
         }
         
         try:
-            response = requests.get(base_url, params=params, timeout=30)
+            response = self.api_session.get(base_url, params=params, timeout=30)
             response.raise_for_status()
             data = response.json()
             
@@ -88,22 +272,32 @@ class USGSLidarFetcher:
         print(f"URL: {download_url}")
         
         try:
-            response = requests.get(download_url, stream=True, timeout=60)
+            response = self.session.get(download_url, stream=True, timeout=60)
             response.raise_for_status()
             
             total_size = int(response.headers.get('content-length', 0))
             
             with open(output_path, 'wb') as f:
-                if total_size > 0:
+                if total_size > 0 and HAVE_TQDM:
+                    # tqdm rate-limits its own redraws
+                    with tqdm(total=total_size, unit='B', unit_scale=True) as pbar:
+                        for chunk in response.iter_content(chunk_size=1 << 20):
+                            f.write(chunk)
+                            pbar.update(len(chunk))
+                elif total_size > 0:
                     downloaded = 0
-                    for chunk in response.iter_content(chunk_size=8192):
+                    # Report every 4 MiB rather than every chunk
+                    next_report = 1 << 22
+                    for chunk in response.iter_content(chunk_size=1 << 20):
                         f.write(chunk)
                         downloaded += len(chunk)
-                        percent = (downloaded / total_size) * 100
-                        print(f"\rProgress: {percent:.1f}%", end='', flush=True)
-                    print()
+                        if downloaded >= next_report:
+                            percent = (downloaded / total_size) * 100
+                            print(f"\rProgress: {percent:.1f}%", end='')
+                            next_report += 1 << 22
+                    print("\rProgress: 100.0%")
                 else:
-                    f.write(response.content)
+                    shutil.copyfileobj(response.raw, f, length=1 << 20)
             
             print(f"Downloaded to: {output_path}")
             return output_path
@@ -123,21 +317,24 @@ class USGSLidarFetcher:
         n_points = 100000
         
         # Create a grid of points with elevation variation
-        x = np.random.uniform(-50, 50, n_points)
-        y = np.random.uniform(-50, 50, n_points)
-        
+        # (float32 throughout: halves the memory traffic; Generator
+        # samples float32 directly, no float64 intermediate)
+        x = rng.random(n_points, dtype=np.float32) * 100 - 50
+        y = rng.random(n_points, dtype=np.float32) * 100 - 50
+
         # Simulate terrain with some hills and valleys
         z = (
             10 * np.sin(x / 10) * np.cos(y / 10) +  # Rolling hills
             5 * np.sin(x / 5) +  # Larger features
             3 * np.cos(y / 8) +  # Cross valleys
-            np.random.normal(0, 0.5, n_points)  # Noise
+            rng.standard_normal(n_points, dtype=np.float32) * 0.5  # Noise
         )
-        
-        # Add some peaks
-        for peak_x, peak_y, peak_h in [(20, 20, 30), (-25, -15, 25)]:
-            dist = np.sqrt((x - peak_x)**2 + (y - peak_y)**2)
-            z += peak_h * np.exp(-dist / 10)
+
+        # Add some peaks, broadcast over all of them at once
+        peaks = np.array([(20, 20, 30), (-25, -15, 25)], dtype=np.float32)
+        dx = x[:, None] - peaks[:, 0]
+        dy = y[:, None] - peaks[:, 1]
+        z += (peaks[:, 2] * np.exp(-np.sqrt(dx * dx + dy * dy) / 10)).sum(axis=1)
         
         # Create LAS file
         header = laspy.LasHeader(point_format=3, version="1.2")
@@ -151,7 +348,7 @@ class USGSLidarFetcher:
         las.z = z
         
         # Add intensity values
-        las.intensity = np.random.randint(0, 65535, n_points, dtype=np.uint16)
+        las.intensity = rng.integers(0, 65535, n_points, dtype=np.uint16)
         
         output_path = self.output_dir / f"sample_lidar_{self.lat}_{self.lon}.laz"
         las.write(str(output_path))
@@ -178,58 +375,61 @@ class USGSLidarFetcher:
         print(f"\nConverting {laz_path.name} to DEM raster...")
         
         try:
-            # Read LAZ file
-            las = laspy.read(str(laz_path))
-            
-            x = las.x
-            y = las.y
-            z = las.z
-            
-            print(f"  Points: {len(x)}")
-            print(f"  X range: [{x.min():.2f}, {x.max():.2f}]")
-            print(f"  Y range: [{y.min():.2f}, {y.max():.2f}]")
-            print(f"  Z range: [{z.min():.2f}, {z.max():.2f}]")
-            
-            # Calculate grid dimensions
-            x_min, x_max = x.min(), x.max()
-            y_min, y_max = y.min(), y.max()
-            
-            if grid_size is None:
-                # Auto-calculate based on resolution
-                width = int((x_max - x_min) / self.resolution)
-                height = int((y_max - y_min) / self.resolution)
-                # Limit to reasonable size
-                width = min(width, 2000)
-                height = min(height, 2000)
-            else:
-                width, height = grid_size
-            
-            print(f"  Creating {width}x{height} grid (resolution: {self.resolution}m)")
-            
-            # Create grid
-            grid_x = np.linspace(x_min, x_max, width)
-            grid_y = np.linspace(y_min, y_max, height)
-            grid_x, grid_y = np.meshgrid(grid_x, grid_y)
-            
-            # Interpolate elevation values
-            print("  Interpolating elevation values...")
-            points = np.column_stack([x, y])
-            
-            # Use nearest neighbor for speed, or linear for quality
-            grid_z = griddata(points, z, (grid_x, grid_y), method='nearest')
-            
-            # Handle any NaN values
-            if np.any(np.isnan(grid_z)):
-                print("  Filling NaN values...")
-                mask = np.isnan(grid_z)
-                grid_z[mask] = np.nanmean(grid_z)
-            
+            # Stream the LAZ file in chunks so peak memory stays
+            # O(chunk_size) instead of O(n_points)
+            with laspy.open(str(laz_path)) as reader:
+                n_points = reader.header.point_count
+                x_min, y_min, z_min_hdr = reader.header.mins
+                x_max, y_max, z_max_hdr = reader.header.maxs
+
+                print(f"  Points: {n_points}")
+                print(f"  X range: [{x_min:.2f}, {x_max:.2f}]")
+                print(f"  Y range: [{y_min:.2f}, {y_max:.2f}]")
+                print(f"  Z range: [{z_min_hdr:.2f}, {z_max_hdr:.2f}]")
+
+                cache_key = (str(laz_path), laz_path.stat().st_mtime, grid_size)
+                cached = self._bounds_cache.get(cache_key)
+                if cached is not None:
+                    width, height, transform = cached
+                else:
+                    if grid_size is None:
+                        # Auto-calculate based on resolution
+                        width = int((x_max - x_min) / self.resolution)
+                        height = int((y_max - y_min) / self.resolution)
+                        # Limit to reasonable size
+                        width = min(width, 2000)
+                        height = min(height, 2000)
+                    else:
+                        width, height = grid_size
+                    transform = from_bounds(x_min, y_min, x_max, y_max,
+                                            width, height)
+                    self._bounds_cache[cache_key] = (width, height, transform)
+
+                print(f"  Creating {width}x{height} grid (resolution: {self.resolution}m)")
+
+                # Rasterize by binning points into cells and averaging,
+                # one chunk at a time
+                print("  Interpolating elevation values...")
+                sums = np.zeros((height, width), dtype=np.float32)
+                counts = np.zeros((height, width), dtype=np.int32)
+                tls = alloc_bin_tls(width, height)
+                for chunk in reader.chunk_iterator(1_000_000):
+                    bin_points(chunk.x, chunk.y, chunk.z,
+                               x_min, x_max, y_min, y_max,
+                               width, height, sums, counts, tls)
+                if tls is not None:
+                    reduce_bin_tls(tls, sums, counts)
+
+            grid_z = np.where(counts > 0,
+                              sums / np.maximum(counts, 1),
+                              np.float32(np.nan)).astype(np.float32, copy=False)
+
+            fill_empty_cells(grid_z, counts)
+
             # Save as GeoTIFF
             output_base = laz_path.stem
             geotiff_path = self.output_dir / f"{output_base}_dem.tif"
             
-            transform = from_bounds(x_min, y_min, x_max, y_max, width, height)
-            
             with rasterio.open(
                 geotiff_path,
                 'w',
@@ -240,14 +440,22 @@ class USGSLidarFetcher:
                 dtype=grid_z.dtype,
                 crs='+proj=latlong',
                 transform=transform,
+                tiled=True,
+                blockxsize=256,
+                blockysize=256,
+                compress='zstd',
+                zstd_level=3,
+                predictor=3,  # floating-point predictor for float32 DEMs
             ) as dst:
                 dst.write(grid_z, 1)
             
             print(f"  Saved GeoTIFF: {geotiff_path}")
             
-            # Also save as numpy array for direct use
+            # Also save as numpy array for direct use; grid_z is already
+            # float32, so write it out without another cast or copy
             npy_path = self.output_dir / f"{output_base}_dem.npy"
-            np.save(npy_path, grid_z.astype(np.float32))
+            with open(npy_path, 'wb') as f:
+                np.lib.format.write_array(f, grid_z, allow_pickle=False)
             print(f"  Saved numpy array: {npy_path}")
             
             # Save metadata
@@ -264,7 +472,7 @@ class USGSLidarFetcher:
                     'z_min': float(grid_z.min()),
                     'z_max': float(grid_z.max())
                 },
-                'source_points': len(x),
+                'source_points': int(n_points),
                 'source_file': str(laz_path.name)
             }
             
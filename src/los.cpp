@@ -1,19 +1,19 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/numpy.h>
 #include <cmath>
+#include <stdexcept>
 
 namespace py = pybind11;
 
-double los_boolean(
-    py::array_t<float, py::array::c_style | py::array::forcecast> heightmap,
+// Core ray traversal over a raw heightmap buffer; contains no Python
+// API calls so it can run outside the GIL and in parallel
+static double los_boolean_raw(
+    const float* ptr,
     int width,
     int height,
     double x0, double y0, double z0,
     double x1, double y1, double z1
 ) {
-    auto buf = heightmap.request();
-    float* ptr = static_cast<float*>(buf.ptr);
-
     // Direction
     double dx = x1 - x0;
     double dy = y1 - y0;
@@ -88,6 +88,18 @@ double los_boolean(
     return 1.0;
 }
 
+double los_boolean(
+    py::array_t<float, py::array::c_style | py::array::forcecast> heightmap,
+    int width,
+    int height,
+    double x0, double y0, double z0,
+    double x1, double y1, double z1
+) {
+    auto buf = heightmap.request();
+    const float* ptr = static_cast<const float*>(buf.ptr);
+    return los_boolean_raw(ptr, width, height, x0, y0, z0, x1, y1, z1);
+}
+
 double los_probability(
     py::array_t<float, py::array::c_style | py::array::forcecast> heightmap,
     int width,
@@ -141,6 +153,38 @@ double los_probability(
     return static_cast<double>(successful_rays) / num_samples;
 }
 
+py::array_t<double> los_boolean_batch(
+    py::array_t<float, py::array::c_style | py::array::forcecast> heightmap,
+    int width,
+    int height,
+    py::array_t<double, py::array::c_style | py::array::forcecast> rays
+) {
+    // Run many rays against the same heightmap in one call, paying the
+    // pybind11 boundary cost once instead of once per ray
+    auto r = rays.unchecked<2>();
+    if (r.shape(1) != 6)
+        throw std::invalid_argument("rays must have shape (N, 6): x0,y0,z0,x1,y1,z1");
+
+    py::ssize_t n = r.shape(0);
+    py::array_t<double> results(n);
+    auto out = results.mutable_unchecked<1>();
+
+    auto buf = heightmap.request();
+    const float* ptr = static_cast<const float*>(buf.ptr);
+
+    {
+        py::gil_scoped_release release;
+        #pragma omp parallel for schedule(static)
+        for (py::ssize_t i = 0; i < n; i++) {
+            out(i) = los_boolean_raw(ptr, width, height,
+                                     r(i, 0), r(i, 1), r(i, 2),
+                                     r(i, 3), r(i, 4), r(i, 5));
+        }
+    }
+
+    return results;
+}
+
 PYBIND11_MODULE(los, m) {
     m.def("los_boolean", &los_boolean, 
           py::arg("heightmap"),
@@ -158,4 +202,11 @@ PYBIND11_MODULE(los, m) {
           py::arg("x1"), py::arg("y1"), py::arg("z1"),
           py::arg("num_samples") = 9,
           "Compute line-of-sight probability by sampling multiple rays (returns 0.0 to 1.0)");
+
+    m.def("los_boolean_batch", &los_boolean_batch,
+          py::arg("heightmap"),
+          py::arg("width"),
+          py::arg("height"),
+          py::arg("rays"),
+          "Check line-of-sight for an (N, 6) array of rays in one call (returns array of 0.0/1.0)");
 }
\ No newline at end of file
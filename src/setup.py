@@ -1,18 +1,37 @@
 #!/usr/bin/env python3
 
+import sys
+
 from setuptools import setup, Extension
 import pybind11
 
+if sys.platform == "win32":
+    extra_compile_args = ["/O2", "/fp:fast", "/openmp"]
+    extra_link_args = []
+else:
+    extra_compile_args = [
+        "-O3",
+        "-march=native",
+        "-ffast-math",
+        "-fno-math-errno",
+        "-funroll-loops",
+        "-fopenmp",
+    ]
+    extra_link_args = ["-flto", "-fopenmp"]
+
 ext_modules = [
     Extension(
         "los",
         ["los.cpp"],
         include_dirs=[pybind11.get_include()],
-        language="c++"
+        language="c++",
+        extra_compile_args=extra_compile_args,
+        extra_link_args=extra_link_args,
+        define_macros=[("NDEBUG", "1")],
     ),
 ]
 
 setup(
     name="los",
     ext_modules=ext_modules,
-)
\ No newline at end of file
+)
@@ -3,15 +3,6 @@
 import numpy as np
 import los
 
-def los_runtime():
-    return los.los_boolean(
-      dem,
-      dem.shape[1],
-      dem.shape[0],
-      x0, y0, z0,
-      x1, y1, z1
-    )
-
 # Grid size
 width = 1000
 height = 1000
@@ -25,13 +16,19 @@ x0, y0, z0 = 100.0, 100.0, 10.0
 x1, y1, z1 = 900.0, 900.0, 10.0
 
 print("=== Test 1: Flat terrain (should be visible) ===")
-print("LOS?:", los_runtime())
+print("LOS?:", los.los_boolean(dem, width, height, x0, y0, z0, x1, y1, z1))
 
-# Add hill in the middle
+# Add hill in the middle; tests 2 and 3 run against this same DEM, so
+# submit both rays in one batched call
 dem[500, 500] = 50.0
+rays = np.array([
+    [x0, y0, z0, x1, y1, z1],
+    [x0, y0, 100.0, x1, y1, 100.0],
+], dtype=np.float64)
+results = los.los_boolean_batch(dem, width, height, rays)
+
 print("\n=== Test 2: Add blocking hill (should be blocked) ===")
-print("LOS?:", los_runtime())
+print("LOS?:", results[0])
 
-z0, z1 = 100.0, 100.0
 print("\n=== Test 3: Raise observers above hill (should be visible) ===")
-print("LOS?:", los_runtime())
\ No newline at end of file
+print("LOS?:", results[1])
\ No newline at end of file
@@ -10,6 +10,7 @@ Usage:
 
 import numpy as np
 import argparse
+import functools
 import json
 from pathlib import Path
 
@@ -36,33 +37,48 @@ def find_latest_dem(data_dir="lidar_data"):
     return npy_files[0]
 
 
-def load_dem_with_metadata(dem_path):
-    """Load DEM and its metadata"""
-    dem = np.load(str(dem_path))
-    
+@functools.lru_cache(maxsize=4)
+def _load_dem_cached(resolved_path):
+    # mmap defers page-in to actual access; the LOS kernel only touches
+    # the pages along the ray
+    dem = np.load(resolved_path, mmap_mode='r')
+
     # Try to load metadata
+    dem_path = Path(resolved_path)
     meta_path = dem_path.parent / f"{dem_path.stem}_meta.json"
     metadata = None
     if meta_path.exists():
         with open(meta_path, 'r') as f:
             metadata = json.load(f)
-    
+
     return dem, metadata
 
 
-def los_boolean_test(dem, width, height, x0, y0, z0, x1, y1, z1):
-    """Wrapper for los.los_boolean with error handling"""
+def load_dem_with_metadata(dem_path):
+    """Load DEM (memory-mapped) and its metadata, cached per process"""
+    return _load_dem_cached(str(Path(dem_path).resolve()))
+
+
+def dem_stats(dem):
+    """
+    Min/max elevations and their cell locations from a single pair of
+    reduction passes (argmin/argmax) instead of four separate scans
+    """
+    flat = dem.ravel()
+    i_min = int(flat.argmin())
+    i_max = int(flat.argmax())
+    min_idx = np.unravel_index(i_min, dem.shape)
+    max_idx = np.unravel_index(i_max, dem.shape)
+    return float(flat[i_min]), float(flat[i_max]), min_idx, max_idx
+
+
+def los_boolean_batch_test(dem, width, height, rays):
+    """Wrapper for los.los_boolean_batch with error handling"""
     try:
-        result = los.los_boolean(
-            dem,
-            width,
-            height,
-            x0, y0, z0,
-            x1, y1, z1
-        )
+        result = los.los_boolean_batch(dem, width, height, rays)
         return result
     except Exception as e:
-        print(f"Error in los_boolean: {e}")
+        print(f"Error in los_boolean_batch: {e}")
         return None
 
 
@@ -121,13 +137,17 @@ def main():
     # Load DEM and metadata
     dem, metadata = load_dem_with_metadata(dem_path)
     
-    # Ensure contiguous array
-    dem = np.ascontiguousarray(dem, dtype=np.float32)
+    # Only materialize a copy when a dtype/layout conversion is needed;
+    # a float32 C-contiguous mmap passes straight through to los
+    if dem.dtype != np.float32 or not dem.flags['C_CONTIGUOUS']:
+        dem = np.ascontiguousarray(dem, dtype=np.float32)
     
     height, width = dem.shape
     
+    z_min, z_max, min_idx, max_idx = dem_stats(dem)
+
     print(f"DEM size: {width}x{height}")
-    print(f"Elevation range: {dem.min():.2f}m to {dem.max():.2f}m")
+    print(f"Elevation range: {z_min:.2f}m to {z_max:.2f}m")
     
     if metadata:
         print(f"Resolution: {metadata.get('resolution', 'unknown')}m/pixel")
@@ -149,79 +169,82 @@ def main():
     
     print(f"\nObserver: ({x0:.1f}, {y0:.1f}, {z0:.1f})")
     print(f"Target:   ({x1:.1f}, {y1:.1f}, {z1:.1f})")
-    
+
+    # Test 2 points: elevated observer and target
+    z0_elevated = float(dem[int(y0), int(x0)] + 20.0)
+    z1_elevated = float(dem[int(y1), int(x1)] + 20.0)
+
+    # Test 3 points: short distance LOS (nearby points)
+    x0_short = float(width // 2)
+    y0_short = float(height // 2)
+    z0_short = float(dem[int(y0_short), int(x0_short)] + 2.0)
+
+    x1_short = float(width // 2 + 10)
+    y1_short = float(height // 2 + 10)
+    z1_short = float(dem[min(int(y1_short), height-1), min(int(x1_short), width-1)] + 2.0)
+
+    # Test 4 points: highest and lowest cells, from the cached stats
+    x0_peak = float(max_idx[1])
+    y0_peak = float(max_idx[0])
+    z0_peak = z_max + 2.0
+
+    x1_valley = float(min_idx[1])
+    y1_valley = float(min_idx[0])
+    z1_valley = z_min + 2.0
+
+    # Run all boolean checks in one batched call; the DEM is traversed
+    # inside the extension without re-crossing the pybind11 boundary
+    rays = np.array([
+        [x0, y0, z0, x1, y1, z1],
+        [x0, y0, z0_elevated, x1, y1, z1_elevated],
+        [x0_short, y0_short, z0_short, x1_short, y1_short, z1_short],
+        [x0_peak, y0_peak, z0_peak, x1_valley, y1_valley, z1_valley],
+    ], dtype=np.float64)
+    results = los_boolean_batch_test(dem, width, height, rays)
+
     # Test 1: Ground level to ground level (likely blocked by terrain)
     print_test_header(1, "Ground level LOS (2m above surface)")
-    result = los_boolean_test(dem, width, height, x0, y0, z0, x1, y1, z1)
-    if result is not None:
-        print(f"LOS visible: {result}")
+    if results is not None:
+        print(f"LOS visible: {results[0]}")
         prob = los_probability_test(dem, width, height, x0, y0, z0, x1, y1, z1)
         if prob is not None:
             print(f"LOS probability: {prob:.4f}")
-    
+
     # Test 2: Elevated observer and target (more likely to see over terrain)
     print_test_header(2, "Elevated LOS (20m above surface)")
-    z0_elevated = float(dem[int(y0), int(x0)] + 20.0)
-    z1_elevated = float(dem[int(y1), int(x1)] + 20.0)
-    
     print(f"Observer: ({x0:.1f}, {y0:.1f}, {z0_elevated:.1f})")
     print(f"Target:   ({x1:.1f}, {y1:.1f}, {z1_elevated:.1f})")
-    
-    result = los_boolean_test(dem, width, height, x0, y0, z0_elevated, x1, y1, z1_elevated)
-    if result is not None:
-        print(f"LOS visible: {result}")
+
+    if results is not None:
+        print(f"LOS visible: {results[1]}")
         prob = los_probability_test(dem, width, height, x0, y0, z0_elevated, x1, y1, z1_elevated)
         if prob is not None:
             print(f"LOS probability: {prob:.4f}")
-    
+
     # Test 3: Short distance LOS (nearby points, usually visible)
     print_test_header(3, "Short distance LOS")
-    x0_short = float(width // 2)
-    y0_short = float(height // 2)
-    z0_short = float(dem[int(y0_short), int(x0_short)] + 2.0)
-    
-    x1_short = float(width // 2 + 10)
-    y1_short = float(height // 2 + 10)
-    z1_short = float(dem[min(int(y1_short), height-1), min(int(x1_short), width-1)] + 2.0)
-    
     print(f"Observer: ({x0_short:.1f}, {y0_short:.1f}, {z0_short:.1f})")
     print(f"Target:   ({x1_short:.1f}, {y1_short:.1f}, {z1_short:.1f})")
-    
-    result = los_boolean_test(dem, width, height, x0_short, y0_short, z0_short, 
-                              x1_short, y1_short, z1_short)
-    if result is not None:
-        print(f"LOS visible: {result}")
+
+    if results is not None:
+        print(f"LOS visible: {results[2]}")
         prob = los_probability_test(dem, width, height, x0_short, y0_short, z0_short,
                                     x1_short, y1_short, z1_short)
         if prob is not None:
             print(f"LOS probability: {prob:.4f}")
-    
-    # Test 4: Find highest and lowest points
+
+    # Test 4: Peak to valley LOS
     print_test_header(4, "Peak to valley LOS")
-    
-    max_idx = np.unravel_index(np.argmax(dem), dem.shape)
-    min_idx = np.unravel_index(np.argmin(dem), dem.shape)
-    
-    x0_peak = float(max_idx[1])
-    y0_peak = float(max_idx[0])
-    z0_peak = float(dem[max_idx] + 2.0)
-    
-    x1_valley = float(min_idx[1])
-    y1_valley = float(min_idx[0])
-    z1_valley = float(dem[min_idx] + 2.0)
-    
     print(f"Peak:   ({x0_peak:.1f}, {y0_peak:.1f}, {z0_peak:.1f})")
     print(f"Valley: ({x1_valley:.1f}, {y1_valley:.1f}, {z1_valley:.1f})")
-    
-    result = los_boolean_test(dem, width, height, x0_peak, y0_peak, z0_peak,
-                              x1_valley, y1_valley, z1_valley)
-    if result is not None:
-        print(f"LOS visible: {result}")
+
+    if results is not None:
+        print(f"LOS visible: {results[3]}")
         prob = los_probability_test(dem, width, height, x0_peak, y0_peak, z0_peak,
                                     x1_valley, y1_valley, z1_valley)
         if prob is not None:
             print(f"LOS probability: {prob:.4f}")
-    
+
     print("\n" + "="*60)
     print("Tests complete!")
     print("="*60)